@@ -0,0 +1,84 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+CLUSTER_BLAST_PATH = "data/cluster_blast.csv.gz"
+CLUSTER_BLAST_TOPK_PATH = "data/cluster_blast_topk.parquet"
+
+# Number of hits kept per (sequence, cluster_type)
+TOP_K = 5
+CHUNK_SIZE = 500_000
+
+KEYS = ['sequence', 'cluster_type']
+
+
+def encode(values, vocabulary):
+    # Map values to integer ids, extending `vocabulary` (list of known values) with the new ones
+    codes, uniques = pd.factorize(values)
+    known = pd.Index(vocabulary).get_indexer(uniques)
+    new = known == -1
+    known[new] = np.arange(len(vocabulary), len(vocabulary) + new.sum())
+    vocabulary.extend(uniques[new])
+    return known[codes].astype(np.int32)
+
+
+def reduce_cluster_blast(path=CLUSTER_BLAST_PATH, k=TOP_K, chunksize=CHUNK_SIZE):
+    # Stream the ClusterBlast hits and keep the k best hits (by similarity) of every (sequence, cluster_type).
+    # Memory is bounded by one chunk plus k rows per region, whatever the size of the file.
+    vocabularies = {key: [] for key in KEYS}
+    best = None
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        chunk = chunk.dropna(subset=KEYS)
+        for key in KEYS:
+            chunk[key] = encode(chunk[key], vocabularies[key])
+        if best is not None:
+            chunk = pd.concat([best, chunk], ignore_index=True)
+        best = (
+            chunk.sort_values('similarity', ascending=False, kind='stable')
+            .groupby(KEYS, sort=False)
+            .head(k)
+        )
+
+    if best is None:
+        best = pd.read_csv(path, nrows=0)
+    # Integer keys are stored as categoricals: the codes are the ids, the categories the original names
+    for key in KEYS:
+        best[key] = pd.Categorical.from_codes(best[key].to_numpy(dtype=np.int32), categories=vocabularies[key])
+    best['rank'] = best.groupby(KEYS, observed=True).cumcount().add(1).astype(np.int32)
+    return best.sort_values(KEYS + ['rank']).reset_index(drop=True)
+
+
+def save_cluster_blast_topk(best, k, topk_path=CLUSTER_BLAST_TOPK_PATH):
+    # k is kept in the parquet metadata so a rebuild reuses the same number of hits
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(best, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b'top_k': str(k).encode()})
+    pq.write_table(table, topk_path)
+
+
+def stored_top_k(topk_path=CLUSTER_BLAST_TOPK_PATH):
+    import pyarrow.parquet as pq
+
+    metadata = pq.read_schema(topk_path).metadata or {}
+    return int(metadata[b'top_k']) if b'top_k' in metadata else None
+
+
+def load_cluster_blast_topk(path=CLUSTER_BLAST_PATH, topk_path=CLUSTER_BLAST_TOPK_PATH, k=None):
+    # Build the compact table once, and again whenever the ClusterBlast output is newer or another k is asked.
+    # With k=None the k of the existing table is kept (TOP_K for a first build).
+    current_k = stored_top_k(topk_path) if os.path.exists(topk_path) else None
+    if k is None:
+        k = current_k or TOP_K
+    if current_k != k or (os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(topk_path)):
+        save_cluster_blast_topk(reduce_cluster_blast(path, k=k), k, topk_path)
+    return pd.read_parquet(topk_path)
+
+
+# Build data/cluster_blast_topk.parquet from data/cluster_blast.csv.gz
+if __name__ == "__main__":
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else TOP_K
+    save_cluster_blast_topk(reduce_cluster_blast(k=k), k)
@@ -0,0 +1,91 @@
+import io
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Number of rows encoded at a time when exporting a table
+CHUNK_SIZE = 10_000
+
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def iter_rows(df, mask=None, chunk_size=CHUNK_SIZE):
+    # Yield consecutive slices of `df`, keeping only the rows selected by `mask`.
+    # Only the positions of the selected rows are materialised, never a filtered copy of the frame.
+    if mask is None:
+        positions = np.arange(len(df))
+    else:
+        positions = np.flatnonzero(np.asarray(mask, dtype=bool))
+    for start in range(0, len(positions), chunk_size):
+        yield df.iloc[positions[start:start + chunk_size]]
+
+
+def iter_csv(df, mask=None, chunk_size=CHUNK_SIZE):
+    header = True
+    for chunk in iter_rows(df, mask, chunk_size):
+        yield chunk.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        # Nothing matched the filters, still export the column names
+        yield df.iloc[:0].to_csv(index=False).encode("utf-8")
+
+
+def iter_parquet(df, mask=None, chunk_size=CHUNK_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Mixed object columns (ex: NaN in string columns) are written as strings so every row group shares one schema
+    df_schema = df.iloc[:0].astype({col: "string" for col in df.select_dtypes(include="object").columns})
+    schema = pa.Schema.from_pandas(df_schema, preserve_index=False)
+
+    sink = io.BytesIO()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in iter_rows(df, mask, chunk_size):
+            chunk = chunk.astype({col: "string" for col in df_schema.select_dtypes(include="string").columns})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            # Hand over the bytes of the row group just written and reset the buffer
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def export_table(df, mask=None, file_format="CSV", chunk_size=CHUNK_SIZE):
+    if file_format == "CSV":
+        return iter_csv(df, mask, chunk_size)
+    elif file_format == "Parquet":
+        return iter_parquet(df, mask, chunk_size)
+    raise ValueError(f"Unknown export format: {file_format}")
+
+
+def taxa_mask(df, taxa_filter, column="FinalTaxonomy", case=True):
+    # Regex match on `column`, pass the `case` of the "Grep a taxa" input of the same page
+    if not taxa_filter:
+        return None
+    try:
+        return df[column].str.contains(taxa_filter, case=case, na=False).to_numpy()
+    except (re.error, ValueError) as e:
+        st.error(f"Invalid taxa filter '{taxa_filter}': {e}")
+        return np.zeros(len(df), dtype=bool)
+
+
+def download_buttons(df, file_name, key, mask=None):
+    n_rows = len(df) if mask is None else int(np.count_nonzero(mask))
+    col1, col2 = st.columns([1, 4])
+    with col1:
+        file_format = st.radio("Export format", list(EXPORT_FORMATS), key=f"{key}_format", horizontal=True)
+    extension, mime = EXPORT_FORMATS[file_format]
+    with col2:
+        st.download_button(
+            label=f"Download {n_rows} rows ({file_format})",
+            # Only encoded when the button is clicked, not on every rerun
+            data=lambda: b"".join(export_table(df, mask, file_format)),
+            file_name=f"{file_name}.{extension}",
+            mime=mime,
+            key=f"{key}_download",
+        )
@@ -0,0 +1,126 @@
+import os
+import ast
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+REGION_SUMMARY_PATH = "data/region_summary.csv"
+INVENTORY_PATH = "data/MAG_inventory_VIRGO2_021623_30Jul2024.txt.gz"
+
+# Columns of region_summary describing the BGC repertoire of a MAG
+PROFILE_FEATURES = ["type", "most_similar_known_cluster", "BGC"]
+
+
+def data_version():
+    # Any change of the input files invalidates the cached matrix
+    return tuple(os.path.getmtime(path) for path in (REGION_SUMMARY_PATH, INVENTORY_PATH))
+
+
+# cache_resource keeps a single shared matrix instead of unpickling a copy on every rerun
+@st.cache_resource
+def load_profile_matrix(version):
+    region_summary = pd.read_csv(REGION_SUMMARY_PATH)
+    virgo2_inventory = pd.read_csv(INVENTORY_PATH, sep='\t', usecols=['MAG', 'FinalTaxonomy'])
+    return build_profile_matrix(region_summary, virgo2_inventory)
+
+
+def build_profile_matrix(region_summary, virgo2_inventory):
+    # Binary MAG x feature matrix (CSR), one row per VIRGO2 MAG, one column per "<feature>: <value>"
+    region = region_summary[['sequence'] + PROFILE_FEATURES].copy()
+    region['MAG'] = region['sequence'].str.split("_").str[0]
+    region['type'] = region['type'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+    region = region.explode('type')
+
+    mags = virgo2_inventory.drop_duplicates('MAG').set_index('MAG')['FinalTaxonomy']
+    mags = pd.concat([mags, pd.Series(index=region.loc[~region['MAG'].isin(mags.index), 'MAG'].unique(), dtype=object)])
+
+    pairs = pd.concat([
+        pd.DataFrame({'MAG': region['MAG'], 'feature': feature + ": " + region[feature].astype(str)})[region[feature].notna().to_numpy()]
+        for feature in PROFILE_FEATURES
+    ]).drop_duplicates()
+
+    features = pd.Index(pairs['feature'].unique()).sort_values()
+    rows = mags.index.get_indexer(pairs['MAG'])
+    cols = features.get_indexer(pairs['feature'])
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+        shape=(len(mags), len(features)),
+    )
+    return matrix, mags, features
+
+
+def top_k_similar(matrix, query, k=20, metric="jaccard", exclude=None):
+    # Similarity of every MAG to a binary query profile with one sparse matrix-vector product
+    query = sparse.csr_matrix(query, dtype=np.float32)
+    query.data[:] = 1
+    query_size = query.nnz
+    if query_size == 0:
+        return np.array([], dtype=int), np.array([])
+
+    intersection = matrix @ query.toarray().ravel()
+    row_size = np.diff(matrix.indptr)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if metric == "jaccard":
+            scores = intersection / (row_size + query_size - intersection)
+        elif metric == "cosine":
+            scores = intersection / np.sqrt(row_size * query_size)
+        else:
+            raise ValueError(f"Unknown similarity metric: {metric}")
+    scores = np.nan_to_num(scores, nan=0.0)
+    if exclude is not None:
+        scores[exclude] = -1
+
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return order, scores[order]
+
+
+def profile_features(matrix, features, row):
+    return list(features[matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]])
+
+
+def page():
+    st.title("MAG similarity")
+
+    matrix, mags, features = load_profile_matrix(data_version())
+
+    st.subheader("BGC profile search", divider='grey')
+    st.info(f"Each MAG is described by its BGC repertoire ({', '.join(PROFILE_FEATURES)}): {matrix.shape[0]} MAGs x {matrix.shape[1]} features", icon="ℹ️")
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        query_by = st.radio("Query", ["MAG", "Taxa"], key='similarity_query_by', horizontal=True)
+        if query_by == "MAG":
+            mags_w_bgc = mags.index[np.diff(matrix.indptr) > 0]
+            query_value = st.selectbox("MAG", sorted(mags_w_bgc), key='similarity_mag')
+            query_rows = np.array([mags.index.get_loc(query_value)])
+        else:
+            query_value = st.selectbox("Taxa", sorted(mags.dropna().unique()), key='similarity_taxa')
+            query_rows = np.flatnonzero((mags == query_value).to_numpy())
+    with col2:
+        metric = st.radio("Similarity", ["jaccard", "cosine"], key='similarity_metric', horizontal=True)
+    with col3:
+        k = st.number_input("Top k", min_value=1, max_value=500, value=20, key='similarity_k')
+
+    # A taxa is queried with the union of the BGC profiles of its MAGs
+    query = sparse.csr_matrix(matrix[query_rows].max(axis=0))
+    st.write("Query profile:", ", ".join(features[query.indices]) if query.nnz else "no BGC")
+
+    order, scores = top_k_similar(matrix, query, k=int(k), metric=metric, exclude=query_rows)
+    result = pd.DataFrame({
+        "MAG": mags.index[order],
+        "FinalTaxonomy": mags.to_numpy()[order],
+        "similarity": scores.round(4),
+        "n_features": np.diff(matrix.indptr)[order],
+        "features": [", ".join(profile_features(matrix, features, row)) for row in order],
+    })
+    st.dataframe(result, use_container_width=True)
+
+
+# Run the page function
+if __name__ == "__main__":
+    page()
@@ -5,6 +5,7 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from pages_content.export import download_buttons, taxa_mask
 
 # Caching the data loading functions to speed up the Streamlit app
 @st.cache_data
@@ -176,7 +177,10 @@ def page():
     st.title("BGC identification")
 
     st.subheader("VIRGO2 inventory", divider='grey')
-    st.dataframe(pd.merge(virgo2_inventory, antismash_status, on='MAG', how='left'))
+    inventory_status = pd.merge(virgo2_inventory, antismash_status, on='MAG', how='left')
+    st.dataframe(inventory_status)
+    inventory_filter = st.text_input(label="Export filter", placeholder="Grep a taxa to export, ex: Lactobacillus, Lactobacillus_iners", key='inventory_filter')
+    download_buttons(inventory_status, "VIRGO2_inventory", key='inventory', mask=taxa_mask(inventory_status, inventory_filter, case=False))
 
     # st.subheader("Proportion of BGC identification - all MAGs", divider='grey')
     col1, col2 = st.columns(2)
@@ -8,6 +8,9 @@ import ast
 import random
 import numpy as np
 import math
+from scipy import sparse
+from pages_content.export import download_buttons, taxa_mask
+from pages_content.cluster_blast import load_cluster_blast_topk
 
 ## Load data
 @st.cache_data
@@ -15,18 +18,23 @@ def load_data():
     # Load data
     region_summary = pd.read_csv("data/region_summary.csv")
     virgo2_inventory = pd.read_csv('data/MAG_inventory_VIRGO2_021623_30Jul2024.txt.gz', sep='\t')
-    cluster_blast = pd.read_csv('data/cluster_blast.csv.gz')
+    cluster_blast = load_cluster_blast_topk()
     taxa_colors = pd.read_csv('data/VIRGO2_taxaKey.csv')
-    return region_summary, virgo2_inventory, cluster_blast, taxa_colors
+    # Regions with at least one ClusterBlast hit, for the "Region best hits" selectbox
+    cluster_blast_regions = pd.Index(cluster_blast['sequence'].unique()).sort_values().tolist()
+    return region_summary, virgo2_inventory, cluster_blast, cluster_blast_regions, taxa_colors
 
-region_summary, virgo2_inventory, cluster_blast, taxa_colors = load_data()
+region_summary, virgo2_inventory, cluster_blast, cluster_blast_regions, taxa_colors = load_data()
 
 ## Data preprocessing
 
-# Keep BGC that have a ClusterBlast similarity score with antismash DB greater than X%
-cluster_blast_df = cluster_blast.copy()
-cluster_blast_df['MAG'] = cluster_blast_df['sequence'].apply(lambda x : x.split("_")[0])
-cluster_blast_df['sequence_w_type'] = cluster_blast_df['sequence'] + "_" + cluster_blast_df['cluster_type']
+# Best ClusterBlast similarity score with antismash DB of each region, indexed by "<sequence>_<cluster_type>"
+cluster_blast_best = cluster_blast[cluster_blast['rank'] == 1].set_index(['sequence', 'cluster_type'])['similarity']
+cluster_blast_best.index = cluster_blast_best.index.get_level_values(0).astype(str) + "_" + cluster_blast_best.index.get_level_values(1).astype(str)
+
+def hit_regions(threshold):
+    # Keep BGC that have a ClusterBlast similarity score with antismash DB greater than X%
+    return cluster_blast_best.index[cluster_blast_best > threshold]
 
 
 region_overview = region_summary.copy()
@@ -39,7 +47,7 @@ region_overview['Family'] = region_overview['classification'].apply(lambda x : x
 region_overview['Genus'] = region_overview['classification'].apply(lambda x : x.split(";")[5][3:])
 region_overview['sequence_w_type'] = region_overview['sequence'] + "_" + region_overview['type']
 
-# region_overview_filtered = region_overview[region_overview['sequence_w_type'].isin(cluster_blast_df[cluster_blast_df['similarity'] > 60]['sequence_w_type'].unique())].dropna()
+# region_overview_filtered = region_overview[region_overview['sequence_w_type'].isin(hit_regions(60))].dropna()
 
 # Make dictionary of colors
 # colors = pc.qualitative.Set3 + pc.qualitative.Pastel1 + pc.qualitative.Set1 + pc.qualitative.Alphabet + pc.qualitative.Light24 + pc.qualitative.Prism + pc.qualitative.Antique + pc.qualitative.Pastel + pc.qualitative.Safe + pc.qualitative.Bold + pc.qualitative.Dark24 + pc.qualitative.Plotly + pc.qualitative.D3 + pc.qualitative.G10 + pc.qualitative.T10
@@ -64,7 +72,7 @@ def display_barplot_bgc_taxonomic_level(annotation_column, top_value, threshold_
         df = region_overview.copy()
         if annotation_column == 'most_similar_known_cluster' or annotation_column == 'most_similar_known_cluster_type':
             df = df.dropna()
-        df = df[df['sequence_w_type'].isin(cluster_blast_df[cluster_blast_df['similarity'] > threshold_similarity]['sequence_w_type'].unique())]
+        df = df[df['sequence_w_type'].isin(hit_regions(threshold_similarity))]
         df = df[[feature, annotation_column]]
         counts = df.groupby([feature, annotation_column]).size().unstack(fill_value=0)
         counts['Total'] = counts.sum(axis=1)
@@ -128,7 +136,7 @@ def get_all_taxa_region_table(taxa, feature, threshold = None):
 
     # Keep region that have a ClusterBlast similarity score with antismash DB greater than X%
     if threshold:
-        region = region[region['sequence_w_type'].isin(cluster_blast_df[cluster_blast_df['similarity'] > threshold]['sequence_w_type'].unique())]
+        region = region[region['sequence_w_type'].isin(hit_regions(threshold))]
     
     region = region[region['FinalTaxonomy'].str.contains(taxa)]
 
@@ -169,6 +177,92 @@ def get_all_taxa_region_table(taxa, feature, threshold = None):
     return all_taxa_table.reset_index(drop=True)
 
 
+@st.cache_data
+def get_participant_prevalence(rank, feature, threshold=None, n_boot=1000, ci=95, seed=0):
+    # Fraction of participants (and of metagenomes) carrying each feature, among those where the taxa was recovered.
+    # Confidence intervals come from a bootstrap over participants: all replicates are drawn at once as a
+    # (n_boot x participants) matrix of resampling weights and applied with two sparse matrix products.
+    inventory = virgo2_inventory[['MAG', 'PID', 'Metagenome', 'FinalTaxonomy']].copy()
+    inventory['Genus'] = virgo2_inventory['classification'].apply(lambda x : x.split(";")[5][3:])
+
+    region = region_overview.dropna(subset=[feature])
+    if threshold:
+        region = region[region['sequence_w_type'].isin(hit_regions(threshold))]
+    carriers = pd.merge(region[['MAG', feature]], inventory[['MAG', 'PID', 'Metagenome', rank]], on='MAG', how='inner')
+
+    participants = pd.Index(inventory['PID'].unique())
+    taxa = pd.Index(inventory[rank].unique())
+    pairs = carriers[[rank, feature]].drop_duplicates().reset_index(drop=True)
+    pair_index = pd.MultiIndex.from_frame(pairs)
+    pair_taxa = taxa.get_indexer(pairs[rank])
+
+    def unit_counts(df, index, keys):
+        # Sparse participants x columns matrix of the number of distinct units (participant or metagenome) per cell
+        counts = df.drop_duplicates().groupby(['PID'] + keys).size().reset_index(name='n')
+        rows = participants.get_indexer(counts['PID'])
+        cols = index.get_indexer(counts[keys[0]] if len(keys) == 1 else pd.MultiIndex.from_frame(counts[keys]))
+        return sparse.csr_matrix((counts['n'].to_numpy(dtype=float), (rows, cols)), shape=(len(participants), len(index)))
+
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(len(participants), np.full(len(participants), 1 / len(participants)), size=n_boot).astype(float)
+
+    tables = []
+    for unit, label in [('PID', 'participants'), ('Metagenome', 'metagenomes')]:
+        unit_cols = [unit] if unit == 'PID' else [unit, 'PID']
+        hosts = unit_counts(inventory[unit_cols + [rank]].drop_duplicates(subset=[unit, rank]), taxa, [rank])
+        carrying = unit_counts(carriers[unit_cols + [rank, feature]].drop_duplicates(subset=[unit, rank, feature]), pair_index, [rank, feature])
+
+        n_hosts = np.asarray(hosts.sum(axis=0)).ravel()[pair_taxa]
+        n_carrying = np.asarray(carrying.sum(axis=0)).ravel()
+
+        boot_hosts = (hosts.T @ weights.T).T[:, pair_taxa]
+        boot_carrying = (carrying.T @ weights.T).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            boot_prevalence = boot_carrying / boot_hosts
+        low, high = np.nanpercentile(boot_prevalence, [(100 - ci) / 2, 100 - (100 - ci) / 2], axis=0)
+
+        tables.append(pd.DataFrame({
+            f'N_{label}_carrying': n_carrying.astype(int),
+            f'N_{label}_w_taxa': n_hosts.astype(int),
+            f'prevalence_{label}': (n_carrying / n_hosts).round(4),
+            f'prevalence_{label}_low': low.round(4),
+            f'prevalence_{label}_high': high.round(4),
+        }))
+
+    return pd.concat([pairs] + tables, axis=1).sort_values([rank, feature]).reset_index(drop=True)
+
+
+def display_prevalence_ci(df, unit, title=None):
+    rank, feature = df.columns[0], df.columns[1]
+    if feature == 'type':
+        color_mapping = color_mapping_type
+    elif feature == 'most_similar_known_cluster_type':
+        color_mapping = color_mapping_clustertype
+    elif feature == 'most_similar_known_cluster':
+        color_mapping = color_mapping_compound
+
+    df = df.assign(
+        error_plus=df[f'prevalence_{unit}_high'] - df[f'prevalence_{unit}'],
+        error_minus=df[f'prevalence_{unit}'] - df[f'prevalence_{unit}_low'],
+    )
+    fig = px.bar(
+        df,
+        x=rank,
+        y=f'prevalence_{unit}',
+        color=feature,
+        error_y='error_plus',
+        error_y_minus='error_minus',
+        barmode='group',
+        color_discrete_map=color_mapping,
+        template='plotly_white',
+        hover_data=[f'N_{unit}_carrying', f'N_{unit}_w_taxa'],
+        height=500,
+        title=title,
+    )
+    fig.update_yaxes(range=[0, 1.05])
+    st.plotly_chart(fig, use_container_width=True)
+
+
 def display_barplot_per_species(df, title=None):
 
     feature = df.columns[1]
@@ -379,6 +473,13 @@ def page():
 
     st.header("Region overview", divider="grey")
     st.dataframe(region_overview)
+    region_filter = st.text_input(label="Export filter", placeholder="Grep a taxa to export, ex: Lactobacillus, Lactobacillus_iners, Lactobacillus|Prevotella", key='region_overview_filter')
+    download_buttons(region_overview, "region_overview", key='region_overview', mask=taxa_mask(region_overview, region_filter))
+
+    st.header("Region best hits", divider = 'grey')
+    st.info(f"Top {cluster_blast['rank'].max()} ClusterBlast hits (similarity with the antiSMASH database) of each region", icon="ℹ️")
+    region_for_hits = st.selectbox("Region", cluster_blast_regions, key='region_for_hits')
+    st.dataframe(cluster_blast[cluster_blast['sequence'] == region_for_hits], hide_index=True)
 
     st.header("Genera comparison", divider = 'grey')
     feature_for_barplot = st.selectbox("Select a feature", ("type", "most_similar_known_cluster_type", "most_similar_known_cluster"), key='taxonomic_level')
@@ -400,6 +501,24 @@ def page():
     species = st.text_input(label="taxa", placeholder="Grep a taxa, ex: Lactobacillus, Lactobacillus_iners, Lactobacillus|Prevotella", label_visibility="hidden")
     all_taxa_table = get_all_taxa_region_table(species, feature_for_species_barplot)
     display_barplot_per_species(all_taxa_table)
+    download_buttons(all_taxa_table, f"taxa_region_table_{feature_for_species_barplot}", key='all_taxa_table')
+
+    st.header("Participant-level prevalence", divider = 'grey')
+    st.info("Taxa with many MAGs from the same participant weigh more in the MAG counts above. Here each participant (or metagenome) where the taxa was recovered counts once, with 95% bootstrap confidence intervals over participants.", icon="ℹ️")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        rank_for_prevalence = st.radio("Taxonomic rank", ["FinalTaxonomy", "Genus"], key='rank_for_prevalence', horizontal=True)
+    with col2:
+        feature_for_prevalence = st.radio("Choose a feature", ["type", "most_similar_known_cluster_type", "most_similar_known_cluster"], key='feature_for_prevalence', index=0, horizontal=True)
+    with col3:
+        unit_for_prevalence = st.radio("Unit", ["participants", "metagenomes"], key='unit_for_prevalence', horizontal=True)
+    taxa_for_prevalence = st.text_input(label="taxa_prevalence", placeholder="Grep a taxa, ex: Lactobacillus, Lactobacillus_iners, Lactobacillus|Prevotella", key='taxa_for_prevalence', label_visibility="hidden")
+    prevalence_table = get_participant_prevalence(rank_for_prevalence, feature_for_prevalence)
+    prevalence_mask = taxa_mask(prevalence_table, taxa_for_prevalence, column=rank_for_prevalence)
+    if prevalence_mask is not None:
+        prevalence_table = prevalence_table[prevalence_mask]
+    display_prevalence_ci(prevalence_table, unit_for_prevalence)
+    st.dataframe(prevalence_table)
 
 # Run the page function
 if __name__ == "__main__":